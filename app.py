@@ -1,72 +1,122 @@
 import os
 import io
 import re
+import csv
 import json
+import collections
+import functools
+import importlib
+import hashlib
+import threading
+import zipfile
 import datetime as dt
-from typing import List, Tuple, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from html import unescape as html_unescape
+from typing import List, Tuple, Dict, Any, Iterable, Iterator
 
 import streamlit as st
 
-# Gemini
+# Streamlit script context (lets worker threads use st.cache_data)
 try:
-    import google.generativeai as genai
+    from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 except Exception:
-    genai = None
+    add_script_run_ctx = get_script_run_ctx = None
 
-# PDF
+# Content hashing (blake3 is SIMD-accelerated; blake2b from stdlib otherwise)
 try:
-    from pypdf import PdfReader
+    import blake3
 except Exception:
-    PdfReader = None
+    blake3 = None
 
-# DOCX
+# JSON export (orjson serializes straight to UTF-8 bytes in C)
 try:
-    import docx  # python-docx
+    import orjson
 except Exception:
-    docx = None
+    orjson = None
 
-# HTML
-try:
-    from bs4 import BeautifulSoup
-except Exception:
-    BeautifulSoup = None
-
-# Images
-try:
-    from PIL import Image
-except Exception:
-    Image = None
-
-# Tables
-try:
-    import pandas as pd
-except Exception:
-    pd = None
+# Heavy optional dependencies (google-generativeai, PyMuPDF/pypdf, python-docx, bs4, lxml, Pillow,
+# pandas) are imported on first use via optional_import(), so a cold start that only sees .txt
+# uploads never pays for them.
 
 
 APP_TITLE = "Voice Analyzer | Persona & Voice Spec (Gemini)"
 MODEL_NAME = "gemini-3-pro-preview"
+W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"  # WordprocessingML
+MC_NS = "{http://schemas.openxmlformats.org/markup-compatibility/2006}"  # mc:AlternateContent
+HISTORY_MAX = 10  # session history entries kept (and shown)
+IMAGE_MAX_SIDE = 1568  # longest side sent to Gemini; larger images only add bytes, not detail
+IMAGE_JPEG_QUALITY = 85
+
+# Precompiled patterns for the text extractors
+# tags and whitespace runs collapse to one space ([^<>] keeps each scan local: linear time)
+_RE_TAG_OR_WS = re.compile(r"(?:<[^<>]+>|\s)+")
+_RE_SCRIPT_STYLE_OPEN = re.compile(r"<(script|style)\b", re.IGNORECASE)
+_RE_SCRIPT_STYLE_CLOSE = {
+    "script": re.compile(r"</script\s*>", re.IGNORECASE),
+    "style": re.compile(r"</style\s*>", re.IGNORECASE),
+}
+_RE_WS = re.compile(r"\s*")
+_RE_NL3 = re.compile(r"\n{3,}")
+_RE_HWS = re.compile(r"[ \t]+")
+_RE_RTF_STOP = re.compile(r"[\\{}\r\n]")
+
+_HEX_DIGITS = frozenset("0123456789abcdefABCDEF")
+
+# CSV decoding: UTF-8 first, then CP950 (Big5 Excel exports common in zh-TW), then UTF-8 dropping bad bytes
+_CSV_ENCODINGS = (("utf-8", "strict"), ("cp950", "strict"), ("utf-8", "ignore"))
+_CSV_ALT_SEPS = ";\t|"  # delimiters sniffed when a comma parse yields a single column
+
+# w:r children that stand for characters (w:br is handled separately: only line breaks count)
+_DOCX_RUN_CHARS = {W_NS + "tab": "\t", W_NS + "ptab": "\t", W_NS + "cr": "\n", W_NS + "noBreakHyphen": "-"}
+
+# RTF groups whose content is never body text
+_RTF_SKIP_DESTS = frozenset({
+    "fonttbl", "colortbl", "stylesheet", "info", "pict", "object", "header", "footer",
+    "headerl", "headerr", "footerl", "footerr", "listtable", "listoverridetable",
+    "rsidtbl", "themedata", "colorschememapping", "latentstyles", "datastore", "xmlnstbl", "generator",
+})
+_RTF_CHARS = {
+    "par": "\n", "line": "\n", "sect": "\n", "page": "\n", "row": "\n",
+    "tab": "\t", "cell": "\t",
+    "emdash": "—", "endash": "–", "bullet": "•",
+    "lquote": "‘", "rquote": "’", "ldblquote": "“", "rdblquote": "”",
+}
 
 
 # -----------------------------
 # Helpers
 # -----------------------------
+@functools.lru_cache(maxsize=None)
+def optional_import(module: str):
+    """Import an optional dependency on first use; None if missing/broken (cached, later calls are free)."""
+    try:
+        return importlib.import_module(module)
+    except Exception:
+        return None
+
+
 def now_str() -> str:
     return dt.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
 
 def clamp_text(text: str, max_chars: int) -> str:
-    text = (text or "").strip()
-    if max_chars <= 0:
+    if not text or max_chars <= 0:
         return ""
-    if len(text) > max_chars:
-        return text[:max_chars] + "\n\n[TRUNCATED]"
-    return text
+    # locate the stripped span instead of strip(): an oversized text is sliced once, never copied whole
+    # (the whitespace scans run in the regex engine, not a per-character Python loop)
+    i = _RE_WS.match(text).end()
+    end = i + max_chars
+    if end < len(text) and not _RE_WS.fullmatch(text, end):
+        return text[i:end] + "\n\n[TRUNCATED]"
+    return text[i:end].rstrip()
 
 
 def bytes_of(uploaded_file) -> bytes:
     """Streamlit UploadedFile safe bytes getter (no cursor issues)."""
     try:
+        # Zero-copy: UploadedFile is a BytesIO built from the upload's bytes, so getvalue() hands back
+        # that same object, and io.BytesIO(raw) in stream_of() shares it again. getbuffer()/memoryview
+        # would not help: io.BytesIO(memoryview) copies, and the cache key / str decode need bytes anyway.
         return uploaded_file.getvalue()
     except Exception:
         # fallback
@@ -74,6 +124,36 @@ def bytes_of(uploaded_file) -> bytes:
         return uploaded_file.read()
 
 
+def content_hash(raw: bytes) -> str:
+    """Fast content fingerprint for upload dedup."""
+    if blake3 is not None:
+        return blake3.blake3(raw).hexdigest()
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+
+# st.cache_data options shared by the extractors: keyed on a content hash of the raw upload bytes,
+# and bounded (the cache is process-wide, shared by all sessions) by entry count per function and TTL
+EXTRACT_CACHE_KW = dict(
+    show_spinner=False,
+    hash_funcs={bytes: content_hash},
+    max_entries=64,
+    ttl=dt.timedelta(hours=1),
+)
+
+
+def json_bytes(obj: Any) -> bytes:
+    """Pretty-printed UTF-8 JSON bytes for downloads (orjson if installed, else stdlib json)."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+
+
+def stream_of(raw: bytes) -> io.BytesIO:
+    """Fresh file-like view over the upload bytes for parsers (io.BytesIO shares the buffer, no copy)."""
+    return io.BytesIO(raw)
+
+
+@st.cache_data(**EXTRACT_CACHE_KW)
 def extract_text_from_plain_bytes(raw: bytes, max_chars: int) -> str:
     try:
         txt = raw.decode("utf-8", errors="ignore")
@@ -82,70 +162,351 @@ def extract_text_from_plain_bytes(raw: bytes, max_chars: int) -> str:
     return clamp_text(txt, max_chars)
 
 
+def _collect_pages(texts: Iterable[str], max_chars: int) -> str:
+    """Write non-empty page texts into one buffer; stop pulling pages once max_chars is reached."""
+    buf = io.StringIO()
+    for t in texts:
+        if not t or not t.strip():
+            continue
+        buf.write(t)
+        buf.write("\n\n")
+        # enough text collected; skip decoding the remaining pages
+        if buf.tell() >= max_chars:
+            break
+    return clamp_text(buf.getvalue(), max_chars)
+
+
+@st.cache_data(**EXTRACT_CACHE_KW)
 def extract_text_from_pdf_bytes(raw: bytes, max_chars: int) -> str:
-    if PdfReader is None:
+    # PyMuPDF preferred (its "fitz" alias is deprecated and warns on import), pypdf as fallback
+    pymupdf = optional_import("pymupdf") or optional_import("fitz")
+    if pymupdf is not None:
+        try:
+            doc = pymupdf.open(stream=stream_of(raw), filetype="pdf")
+            try:
+                return _collect_pages((page.get_text("text") for page in doc), max_chars)
+            finally:
+                doc.close()
+        except Exception:
+            pass  # fall through to pypdf
+
+    pypdf = optional_import("pypdf")
+    if pypdf is None:
         return ""
     try:
-        reader = PdfReader(io.BytesIO(raw))
-        chunks = []
-        for page in reader.pages:
-            t = page.extract_text() or ""
-            if t.strip():
-                chunks.append(t)
-        return clamp_text("\n\n".join(chunks), max_chars)
+        reader = pypdf.PdfReader(stream_of(raw))
+        return _collect_pages((page.extract_text() for page in reader.pages), max_chars)
     except Exception:
         return ""
 
 
+def _docx_paragraph_text(p) -> str:
+    """Paragraph text from its runs, like python-docx: w:t text, w:tab -> tab, w:br/w:cr -> newline."""
+    out = []
+    for r in p.iter(W_NS + "r"):
+        for c in r:
+            if c.tag == W_NS + "t":
+                out.append(c.text or "")
+            elif c.tag == W_NS + "br":
+                # page/column breaks carry no text
+                if c.get(W_NS + "type", "textWrapping") == "textWrapping":
+                    out.append("\n")
+            else:
+                out.append(_DOCX_RUN_CHARS.get(c.tag, ""))
+    return "".join(out)
+
+
+def _docx_text_via_xml(raw: bytes, max_chars: int) -> str:
+    """Read paragraph runs straight from word/document.xml (no python-docx object per paragraph)."""
+    etree = optional_import("lxml.etree")
+    paras = []
+    total = 0
+    with zipfile.ZipFile(stream_of(raw)) as zf, zf.open("word/document.xml") as fh:
+        for _, p in etree.iterparse(fh, events=("end",), tag=W_NS + "p"):
+            # text boxes appear twice (mc:Choice and the legacy mc:Fallback copy): keep only the Choice
+            if any(a.tag == MC_NS + "Fallback" for a in p.iterancestors()):
+                t = ""
+            else:
+                t = _docx_paragraph_text(p)
+            # free parsed nodes as we go
+            p.clear()
+            while p.getprevious() is not None:
+                del p.getparent()[0]
+            if not t.strip():
+                continue
+            paras.append(t)
+            total += len(t) + 1
+            if total >= max_chars:
+                break
+    return clamp_text("\n".join(paras), max_chars)
+
+
+@st.cache_data(**EXTRACT_CACHE_KW)
 def extract_text_from_docx_bytes(raw: bytes, max_chars: int) -> str:
+    if optional_import("lxml.etree") is not None:
+        try:
+            return _docx_text_via_xml(raw, max_chars)
+        except Exception:
+            pass  # fall through to python-docx
+
+    docx = optional_import("docx")  # python-docx
     if docx is None:
         return ""
     try:
-        d = docx.Document(io.BytesIO(raw))
-        paras = [p.text for p in d.paragraphs if p.text and p.text.strip()]
+        d = docx.Document(stream_of(raw))
+        paras = []
+        total = 0
+        for p in d.paragraphs:
+            t = p.text
+            if not t or not t.strip():
+                continue
+            paras.append(t)
+            total += len(t) + 1
+            # enough text collected; skip the remaining paragraphs
+            if total >= max_chars:
+                break
         return clamp_text("\n".join(paras), max_chars)
     except Exception:
         return ""
 
 
+def _drop_script_style(html: str) -> str:
+    """
+    Remove <script>/<style> ... </script|style> blocks in one linear pass.
+    Once a tag type has no closing tag left, it is never searched for again (unclosed opens
+    are left to the plain tag pattern), so repeated unclosed tags cannot go quadratic.
+    """
+    closers = dict(_RE_SCRIPT_STYLE_CLOSE)
+    out: List[str] = []
+    pos = 0
+    while closers:
+        m = _RE_SCRIPT_STYLE_OPEN.search(html, pos)
+        if m is None:
+            break
+        tag = m.group(1).lower()
+        close_re = closers.get(tag)
+        c = close_re.search(html, m.end()) if close_re is not None else None
+        if c is None:
+            closers.pop(tag, None)
+            out.append(html[pos:m.end()])
+            pos = m.end()
+            continue
+        out.append(html[pos:m.start()])
+        out.append(" ")
+        pos = c.end()
+    out.append(html[pos:])
+    return "".join(out)
+
+
+@st.cache_data(**EXTRACT_CACHE_KW)
 def extract_text_from_html_bytes(raw: bytes, max_chars: int) -> str:
     try:
         html = raw.decode("utf-8", errors="ignore")
     except Exception:
         return ""
 
-    if BeautifulSoup is None:
-        # best-effort strip tags
-        text = re.sub(r"<[^>]+>", " ", html)
-        text = re.sub(r"\s+", " ", text)
+    bs4 = optional_import("bs4")
+    if bs4 is None:
+        # best-effort: drop script/style bodies, strip tags in one pass, then decode entities (&amp; etc.)
+        text = html_unescape(_RE_TAG_OR_WS.sub(" ", _drop_script_style(html)))
         return clamp_text(text, max_chars)
 
     try:
-        soup = BeautifulSoup(html, "html.parser")
+        try:
+            # C-based lxml backend if available
+            parser = "lxml" if optional_import("lxml") is not None else "html.parser"
+            soup = bs4.BeautifulSoup(html, parser)
+        except Exception:
+            # lxml rejected the document (or its install is broken): retry with the stdlib parser
+            soup = bs4.BeautifulSoup(html, "html.parser")
         text = soup.get_text(separator="\n")
-        text = re.sub(r"\n{3,}", "\n\n", text)
+        text = _RE_NL3.sub("\n\n", text)
         return clamp_text(text, max_chars)
     except Exception:
         return ""
 
 
+def _strip_rtf(rtf: str) -> str:
+    """
+    Single-pass RTF -> plain text scanner (linear time, no regex backtracking).
+    Tracks brace depth and control-word state; skips {\*...} and non-text destination groups.
+    """
+    out: List[str] = []
+    hexbuf = bytearray()  # consecutive \'hh bytes, decoded together (multi-byte code pages)
+    codepage = "cp1252"
+    uc = 1  # fallback chars that follow each \uN
+    pending_skip = 0
+    high_surrogate = None  # \uN pairs encode non-BMP chars as two UTF-16 units
+    depth = 0
+    skip_depth = -1  # depth of the group being skipped; -1 = not skipping
+    group_start = False  # right after "{": the first control word may name a destination
+    i, n = 0, len(rtf)
+
+    def flush():
+        if hexbuf:
+            out.append(hexbuf.decode(codepage, errors="ignore"))
+            hexbuf.clear()
+
+    while i < n:
+        c = rtf[i]
+
+        if c == "{":
+            depth += 1
+            group_start = True
+            i += 1
+            continue
+
+        if c == "}":
+            if skip_depth == depth:
+                skip_depth = -1
+            depth -= 1
+            group_start = False
+            i += 1
+            continue
+
+        if c in "\r\n":
+            i += 1
+            continue
+
+        if c != "\\":
+            # plain run up to the next special char
+            m = _RE_RTF_STOP.search(rtf, i)
+            j = m.start() if m else n
+            group_start = False
+            if skip_depth < 0:
+                run = rtf[i:j]
+                if pending_skip:
+                    drop = min(pending_skip, len(run))
+                    run = run[drop:]
+                    pending_skip -= drop
+                if run:
+                    flush()
+                    out.append(run)
+            i = j
+            continue
+
+        nxt = rtf[i + 1] if i + 1 < n else ""
+
+        # control word: \word[-N][ ]
+        if nxt.isascii() and nxt.isalpha():
+            j = i + 1
+            while j < n and rtf[j].isascii() and rtf[j].isalpha():
+                j += 1
+            word = rtf[i + 1:j]
+            k = j + 1 if j < n and rtf[j] == "-" else j
+            while k < n and rtf[k].isdigit():
+                k += 1
+            param = rtf[j:k]
+            if k < n and rtf[k] == " ":
+                k += 1
+            i = k
+
+            if group_start and skip_depth < 0 and word in _RTF_SKIP_DESTS:
+                skip_depth = depth
+            group_start = False
+            if skip_depth >= 0:
+                continue
+
+            if word == "ansicpg" and param.isdigit():
+                codepage = f"cp{param}"
+                try:
+                    b"".decode(codepage)
+                except LookupError:
+                    codepage = "cp1252"
+            elif word == "uc" and param.isdigit():
+                uc = int(param)
+            elif word == "u" and param and param != "-":
+                flush()
+                pending_skip = uc
+                # \uN is a signed 16-bit UTF-16 code unit; anything else is malformed -> skip it
+                cp = int(param)
+                if cp < 0:
+                    cp += 65536
+                if not 0 <= cp <= 0xFFFF:
+                    high_surrogate = None
+                elif 0xD800 <= cp <= 0xDBFF:
+                    high_surrogate = cp
+                elif 0xDC00 <= cp <= 0xDFFF:
+                    if high_surrogate is not None:
+                        out.append(chr(0x10000 + ((high_surrogate - 0xD800) << 10) + (cp - 0xDC00)))
+                    high_surrogate = None
+                else:
+                    out.append(chr(cp))
+                    high_surrogate = None
+            elif word in _RTF_CHARS:
+                flush()
+                out.append(_RTF_CHARS[word])
+            continue
+
+        # \* marks an optional destination: skip the whole group
+        if nxt == "*":
+            if group_start and skip_depth < 0:
+                skip_depth = depth
+            i += 2
+            continue
+
+        group_start = False
+
+        # \'hh hex-encoded byte in the document code page
+        if nxt == "'":
+            if skip_depth < 0:
+                if pending_skip:
+                    pending_skip -= 1
+                else:
+                    hh = rtf[i + 2:i + 4]
+                    if len(hh) == 2 and hh[0] in _HEX_DIGITS and hh[1] in _HEX_DIGITS:
+                        hexbuf.append(int(hh, 16))
+                    else:
+                        # malformed: drop the "\'" and let the following chars be read normally
+                        i += 2
+                        continue
+            i += 4
+            continue
+
+        # control symbol
+        i += 2
+        if skip_depth >= 0:
+            continue
+        if nxt in "\\{}":
+            flush()
+            out.append(nxt)
+        elif nxt == "~":
+            flush()
+            out.append(" ")
+        elif nxt == "_":
+            flush()
+            out.append("-")
+        elif nxt in "\r\n":
+            flush()
+            out.append("\n")
+
+    flush()
+    return "".join(out)
+
+
+@st.cache_data(**EXTRACT_CACHE_KW)
 def extract_text_from_rtf_bytes(raw: bytes, max_chars: int) -> str:
-    # Minimal RTF stripper (best-effort)
     try:
         rtf = raw.decode("utf-8", errors="ignore")
+        text = _RE_HWS.sub(" ", _strip_rtf(rtf))
+        text = _RE_NL3.sub("\n\n", text)
+        return clamp_text(text, max_chars)
     except Exception:
         return ""
-    text = re.sub(r"{\\.*?}|\\[a-zA-Z]+\d* ?", " ", rtf)
-    text = re.sub(r"[{}]", " ", text)
-    text = re.sub(r"\s+", " ", text)
-    return clamp_text(text, max_chars)
 
 
+@st.cache_data(**EXTRACT_CACHE_KW)
 def load_image_from_bytes(raw: bytes):
+    """Decode, downscale and re-encode as JPEG -> Gemini inline blob {"mime_type", "data"}."""
+    Image = optional_import("PIL.Image")
     if Image is None:
         return None
     try:
-        return Image.open(io.BytesIO(raw)).convert("RGB")
+        img = Image.open(stream_of(raw)).convert("RGB")
+        img.thumbnail((IMAGE_MAX_SIDE, IMAGE_MAX_SIDE), Image.Resampling.LANCZOS)
+        out = io.BytesIO()
+        img.save(out, format="JPEG", quality=IMAGE_JPEG_QUALITY)
+        return {"mime_type": "image/jpeg", "data": out.getvalue()}
     except Exception:
         return None
 
@@ -156,58 +517,79 @@ def summarize_dataframe_voice(df, sheet_name: str, max_rows_per_col: int, max_ce
         return ""
 
     blocks = [f"=== [TABLE SHEET: {sheet_name}] ==="]
-    for col in df.columns:
+
+    # only a handful of samples per column are kept: slice rows once, then clean the small frame
+    head_df = df.head(max_rows_per_col * 2)
+    for col, series in head_df.items():
         try:
-            series = df[col].dropna().astype(str).str.strip()
+            series = series.dropna().astype(str).str.strip()
         except Exception:
             continue
 
         # filter blanks after strip
-        series = series[series != ""]
-        if series.empty:
-            continue
-
-        samples = series.head(max_rows_per_col).tolist()
+        samples = series[series != ""].str[:max_cell_chars].head(max_rows_per_col).tolist()
         if not samples:
             continue
 
         blocks.append(f"【欄位：{str(col)}】")
-        for s in samples:
-            s = s[:max_cell_chars]
-            blocks.append(f"- {s}")
+        blocks.extend(f"- {s}" for s in samples)
 
     blocks.append(f"=== [/TABLE SHEET: {sheet_name}] ===")
     return "\n".join(blocks)
 
 
+@st.cache_data(**EXTRACT_CACHE_KW)
+def _read_csv_sample(pd, raw: bytes, nrows: int):
+    """
+    CSV: only the sampled rows are needed; keep cells as strings (no type inference).
+    Encodings are tried in _CSV_ENCODINGS order; dropping undecodable bytes is the last resort.
+    """
+    for encoding, errors in _CSV_ENCODINGS:
+        opts = dict(nrows=nrows, dtype=str, on_bad_lines="skip", encoding=encoding, encoding_errors=errors)
+        try:
+            df = pd.read_csv(stream_of(raw), engine="c", **opts)
+            if len(df.columns) == 1:
+                # with on_bad_lines="skip" a ';'/tab/'|' file does not raise, it comes back as one column
+                sample = raw[:8192].decode(encoding, errors="ignore")
+                try:
+                    sep = csv.Sniffer().sniff(sample, delimiters=_CSV_ALT_SEPS).delimiter
+                except csv.Error:
+                    return df  # genuinely one column
+                df = pd.read_csv(stream_of(raw), engine="c", sep=sep, **opts)
+            return df
+        except UnicodeDecodeError:
+            continue
+    raise ValueError("CSV could not be decoded")
+
+
 def extract_text_from_table_bytes(raw: bytes, filename: str, max_chars: int, max_rows_per_col: int = 8) -> str:
     """
     CSV / Excel -> voice evidence text
     - Excel: summarize up to first few sheets (to avoid huge prompts)
     """
+    pd = optional_import("pandas")
     if pd is None:
         return ""
 
     name = filename.lower()
-    bio = io.BytesIO(raw)
 
     try:
         if name.endswith(".csv"):
-            # CSV: let pandas infer encoding best-effort
-            df = pd.read_csv(bio)
+            df = _read_csv_sample(pd, raw, nrows=max_rows_per_col * 8)
             text = summarize_dataframe_voice(df, "CSV", max_rows_per_col=max_rows_per_col, max_cell_chars=160)
             return clamp_text(text, max_chars)
 
-        # Excel: read multiple sheets
-        sheets: Dict[str, Any] = pd.read_excel(bio, sheet_name=None)
+        # Excel: open the workbook once (openpyxl read_only / xlrd), then parse only the sheets
+        # and rows that get sampled
         blocks = [f"=== [EXCEL FILE: {filename}] ==="]
-
-        # limit sheets to avoid explosion
-        for i, (sname, df) in enumerate(sheets.items()):
-            if i >= 5:
-                blocks.append("...（其餘工作表略過）")
-                break
-            blocks.append(summarize_dataframe_voice(df, sname, max_rows_per_col=max_rows_per_col, max_cell_chars=160))
+        with pd.ExcelFile(stream_of(raw)) as xls:
+            # limit sheets to avoid explosion
+            for i, sname in enumerate(xls.sheet_names):
+                if i >= 5:
+                    blocks.append("...（其餘工作表略過）")
+                    break
+                df = xls.parse(sheet_name=sname, nrows=max_rows_per_col * 4)
+                blocks.append(summarize_dataframe_voice(df, sname, max_rows_per_col=max_rows_per_col, max_cell_chars=160))
 
         blocks.append(f"=== [/EXCEL FILE: {filename}] ===")
         return clamp_text("\n\n".join([b for b in blocks if b.strip()]), max_chars)
@@ -216,24 +598,62 @@ def extract_text_from_table_bytes(raw: bytes, filename: str, max_chars: int, max
         return ""
 
 
-def build_prompt(
-    sample_blocks: List[str],
-    notes: str,
-    constraints: str,
-    output_language: str,
-    attachments_report: str,
-) -> str:
-    samples_joined = "\n\n".join([b for b in sample_blocks if b.strip()]).strip()
-    notes = (notes or "").strip()
-    constraints = (constraints or "").strip()
+def write_sample_block(buf: io.StringIO, header: str, body: str, footer: str) -> None:
+    """Append one evidence block to the shared samples buffer (blank line between blocks)."""
+    if buf.tell():
+        buf.write("\n\n")
+    buf.write(header)
+    buf.write("\n")
+    buf.write(body)
+    buf.write("\n")
+    buf.write(footer)
+
+
+def file_ext(filename: str) -> str:
+    return filename.lower().split(".")[-1] if "." in filename else ""
+
+
+IMAGE_EXTS = frozenset({"png", "jpg", "jpeg", "webp"})
+TABLE_EXTS = frozenset({"csv", "xlsx", "xls"})
+_EXTRACTORS = {
+    "txt": extract_text_from_plain_bytes,
+    "md": extract_text_from_plain_bytes,
+    "pdf": extract_text_from_pdf_bytes,
+    "docx": extract_text_from_docx_bytes,
+    "html": extract_text_from_html_bytes,
+    "htm": extract_text_from_html_bytes,
+    "rtf": extract_text_from_rtf_bytes,
+}
+
+
+def extract_upload(raw: bytes, ext: str, filename: str, max_chars: int, max_rows_per_col: int) -> Tuple[str, Any]:
+    """
+    Single dispatcher for one upload: the bytes are read once by the caller and every branch
+    (including the plain-text fallback) works from them.
+    -> ("image", blob or None) / ("text", extracted text)
+    """
+
+    # Image files -> multimodal
+    if ext in IMAGE_EXTS:
+        return "image", load_image_from_bytes(raw)
+
+    # Text extractable (tables take extra args)
+    if ext in TABLE_EXTS:
+        extracted = extract_text_from_table_bytes(
+            raw=raw,
+            filename=filename,
+            max_chars=max_chars,
+            max_rows_per_col=max_rows_per_col
+        )
+    else:
+        # table lookup; unknown extension -> fallback: try read as text
+        extracted = _EXTRACTORS.get(ext, extract_text_from_plain_bytes)(raw, max_chars=max_chars)
 
-    lang_rule = {
-        "繁體中文": "請用繁體中文輸出。",
-        "English": "Please write in English.",
-        "日本語": "日本語で出力してください。",
-    }.get(output_language, "請用繁體中文輸出。")
+    return "text", extracted
 
-    return f"""
+
+# Static prompt segments (build_prompt splices the dynamic parts in between)
+_PROMPT_HEAD = """\
 你是一個「語感/風格/價值觀」分析器。你的任務：從樣本文本（以及必要時對圖片內容的理解）歸納作者的 Persona 與可執行的寫作規格（Voice Spec），並輸出可直接貼入另一個專案封包的 VOICE CONTEXT。
 
 【重要規則】
@@ -243,10 +663,12 @@ def build_prompt(
 4) 「我的筆記」= 語境校準層：可以補足作者定位/價值觀脈絡；若與證據層衝突，必須指出衝突並給出兩套版本（V-A: 以證據為準；V-B: 以筆記為準）。
 5) 禁止引用任何樣本文本原句超過 25 字；不得大量抄錄。
 6) 你的輸出必須可執行：要能讓另一個 AI 按規格穩定模仿寫作。
-7) {lang_rule}
+7) """
+_PROMPT_REPORT = """
 
 【你收到的附件狀態（供你判斷證據強度）】
-{attachments_report}
+"""
+_PROMPT_CONSTRAINTS = """
 
 【輸出格式（嚴格）】
 A) Persona Brief（可讀）
@@ -280,41 +702,110 @@ D) 快速驗收清單（讓總編輯快速檢查是否像他）
 - 3 個「不像」的警戒
 
 【額外限制/偏好（若有，必須遵守）】
-{constraints if constraints else "（無）"}
+"""
+_PROMPT_SAMPLES = """
 
 【樣本文本（證據層）】
-{samples_joined if samples_joined else "（目前沒有可抽取文本。請先指出不足，並在可推論範圍內給一版『低信心』規格，提醒需要更多樣本或請我貼關鍵段落。）"}
+"""
+_PROMPT_NOTES = """
 
 【我的筆記（語境校準層）】
-{notes if notes else "（未提供）"}
-""".strip()
+"""
+_PROMPT_NO_SAMPLES = "（目前沒有可抽取文本。請先指出不足，並在可推論範圍內給一版『低信心』規格，提醒需要更多樣本或請我貼關鍵段落。）"
 
+_LANG_RULES = {
+    "繁體中文": "請用繁體中文輸出。",
+    "English": "Please write in English.",
+    "日本語": "日本語で出力してください。",
+}
 
-def call_gemini_multimodal(
+
+def build_prompt(
+    samples_text: str,
+    notes: str,
+    constraints: str,
+    output_language: str,
+    attachments_report: str,
+) -> str:
+    # Not cached: one join is cheaper than any cache lookup (hashing these same inputs), and a
+    # process-wide cache would keep users' notes/evidence in memory shared across sessions
+    notes = (notes or "").strip()
+    constraints = (constraints or "").strip()
+
+    # Assemble fragments and join once: the samples buffer is copied into the prompt exactly once
+    parts = [
+        _PROMPT_HEAD,
+        _LANG_RULES.get(output_language, _LANG_RULES["繁體中文"]),
+        _PROMPT_REPORT,
+        attachments_report,
+        _PROMPT_CONSTRAINTS,
+        constraints if constraints else "（無）",
+        _PROMPT_SAMPLES,
+        samples_text if samples_text else _PROMPT_NO_SAMPLES,
+        _PROMPT_NOTES,
+        notes if notes else "（未提供）",
+    ]
+    return "".join(parts)
+
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def _get_model(api_key: str):
+    """
+    One model per API key, shared across reruns/sessions so analyses reuse its client/channel.
+    genai.configure() is process-global (another session may reconfigure it), so the model gets
+    its own client carrying this key instead of the default client. That relies on the SDK's private
+    GenerativeModel._client (google-generativeai is pinned <0.9 in requirements.txt); the client is
+    built with the same user-agent client_info the SDK's own client manager sets.
+    """
+    genai = optional_import("google.generativeai")
+    glm = optional_import("google.ai.generativelanguage")
+    client_info = optional_import("google.api_core.gapic_v1.client_info")
+    if genai is None or glm is None or client_info is None:
+        raise RuntimeError("google-generativeai 未安裝或匯入失敗。請確認 requirements.txt。")
+
+    model = genai.GenerativeModel(MODEL_NAME)
+    if not hasattr(model, "_client"):
+        raise RuntimeError("google-generativeai 版本不相容（缺少 GenerativeModel._client）。請依 requirements.txt 安裝。")
+    model._client = glm.GenerativeServiceClient(
+        client_options={"api_key": api_key},
+        client_info=client_info.ClientInfo(user_agent=f"genai-py/{genai.__version__}"),
+    )
+    return model
+
+
+def _gemini_request(
     api_key: str,
     prompt_text: str,
     images: List,
     temperature: float,
     max_output_tokens: int,
-) -> str:
-    if genai is None:
-        raise RuntimeError("google-generativeai 未安裝或匯入失敗。請確認 requirements.txt。")
-
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel(MODEL_NAME)
+) -> Tuple[Any, List, Dict[str, Any]]:
+    """Shared setup for the blocking and streaming calls: (model, parts, generation_config)."""
+    model = _get_model(api_key)  # raises RuntimeError if the SDK is missing
 
     parts = [prompt_text]
     for img in images:
         if img is not None:
             parts.append(img)
 
-    resp = model.generate_content(
-        parts,
-        generation_config={
-            "temperature": temperature,
-            "max_output_tokens": max_output_tokens,
-        },
+    generation_config = {
+        "temperature": temperature,
+        "max_output_tokens": max_output_tokens,
+    }
+    return model, parts, generation_config
+
+
+def call_gemini_multimodal(
+    api_key: str,
+    prompt_text: str,
+    images: List,
+    temperature: float,
+    max_output_tokens: int,
+) -> str:
+    model, parts, generation_config = _gemini_request(
+        api_key, prompt_text, images, temperature, max_output_tokens
     )
+    resp = model.generate_content(parts, generation_config=generation_config)
 
     text = getattr(resp, "text", None)
     if text:
@@ -327,6 +818,86 @@ def call_gemini_multimodal(
         return str(resp)
 
 
+def stream_gemini_multimodal(
+    api_key: str,
+    prompt_text: str,
+    images: List,
+    temperature: float,
+    max_output_tokens: int,
+) -> Iterator[str]:
+    """Same request as call_gemini_multimodal, but yields text chunks as they are generated."""
+    model, parts, generation_config = _gemini_request(
+        api_key, prompt_text, images, temperature, max_output_tokens
+    )
+    resp = model.generate_content(parts, generation_config=generation_config, stream=True)
+
+    produced = False
+    for chunk in resp:
+        # a chunk without content parts (e.g. the final one carrying only finish_reason) has no text
+        if not (chunk.candidates and chunk.candidates[0].content.parts):
+            continue
+        text = chunk.text
+        if text:
+            produced = True
+            yield text
+
+    if not produced:
+        # blocked prompt / early stop: raise the reason instead of leaving an empty result
+        raise RuntimeError(f"Gemini 未回傳任何文字（{_no_text_reason(resp)}）")
+
+
+def _no_text_reason(resp) -> str:
+    """Why a (fully consumed) response has no text: prompt block reason, else the finish_reason."""
+    feedback = getattr(resp, "prompt_feedback", None)
+    block_reason = getattr(feedback, "block_reason", None)
+    if block_reason:
+        return f"prompt 被封鎖：{getattr(block_reason, 'name', block_reason)}"
+    try:
+        finish_reason = resp.candidates[0].finish_reason
+    except Exception:
+        return "無候選回應"
+    return f"finish_reason={getattr(finish_reason, 'name', finish_reason)}"
+
+
+def response_key(prompt_text: str, images: List, temperature: float, max_output_tokens: int) -> str:
+    """Fingerprint of everything that determines a Gemini response (prompt, image bytes, params)."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(prompt_text.encode("utf-8"))
+    for img in images:
+        if img is not None:
+            h.update(img["data"])
+    h.update(f"{MODEL_NAME}:{temperature}:{max_output_tokens}".encode())
+    return h.hexdigest()
+
+
+def call_gemini_batch(api_key: str, jobs: List[Dict[str, Any]], max_workers: int = 4) -> List[Tuple[str, str]]:
+    """
+    Run queued analyses concurrently (server-side batching shares the work).
+    Returns [(output, error)] in the same order as jobs.
+    """
+    def _run(job: Dict[str, Any]) -> Tuple[str, str]:
+        try:
+            return call_gemini_multimodal(
+                api_key=api_key,
+                prompt_text=job["prompt_text"],
+                images=job["images"],
+                temperature=job["temperature"],
+                max_output_tokens=job["max_output_tokens"],
+            ), ""
+        except Exception as e:
+            return "", str(e)
+
+    if not jobs:
+        return []
+    # attach the script context to the workers so the cached _get_model lookup works there
+    ctx = get_script_run_ctx() if get_script_run_ctx else None
+    with ThreadPoolExecutor(
+        max_workers=max(1, min(max_workers, len(jobs))),
+        initializer=(lambda: add_script_run_ctx(threading.current_thread(), ctx)) if ctx else None,
+    ) as ex:
+        return list(ex.map(_run, jobs))
+
+
 # -----------------------------
 # UI
 # -----------------------------
@@ -395,6 +966,19 @@ with col2:
     st.subheader("4) 一鍵產出")
     run = st.button("🚀 開始語感分析", type="primary", use_container_width=True)
 
+    if "pending" not in st.session_state:
+        st.session_state.pending = []
+
+    qcol1, qcol2 = st.columns(2)
+    with qcol1:
+        queue = st.button("➕ 加入批次佇列（目前參數）", use_container_width=True)
+    with qcol2:
+        run_batch = st.button(
+            f"📦 批次執行（{len(st.session_state.pending)} 筆）",
+            use_container_width=True,
+            disabled=not st.session_state.pending,
+        )
+
     st.info(
         "策略：能抽字就抽字；Excel/CSV 轉成『欄位＋樣例』摘要；圖檔直接附給模型。\n"
         "若掃描 PDF 抽不到字，建議改傳可選取文字的 PDF，或直接上傳截圖/圖片。"
@@ -404,100 +988,175 @@ with col2:
 # -----------------------------
 # Prepare evidence
 # -----------------------------
-sample_blocks: List[str] = []
+sample_buf = io.StringIO()
 images: List = []
 report_lines: List[str] = []
 total_chars = 0
+remaining = max_total_chars  # text budget left for the prompt
 
 if uploads:
-    for f in uploads:
-        filename = f.name
-        ext = filename.lower().split(".")[-1] if "." in filename else ""
-        mime = getattr(f, "type", "")
-
+    # Read once; extractors are st.cache_data-memoized on these bytes, so reruns skip parsing.
+    # Identical content uploaded twice is parsed once and included once.
+    files = []
+    first_by_hash: Dict[str, int] = {}
+    for i, f in enumerate(uploads):
         raw = bytes_of(f)
+        h = content_hash(raw)
+        first = first_by_hash.setdefault(h, i)
+        ext = file_ext(f.name)
+        key = (h, ext, max_chars_per_file, max_rows_per_col)
+        files.append((f.name, ext, getattr(f, "type", ""), raw, first, key))
+
+    # Session-level results: steady-state reruns reuse them without touching any extractor.
+    # Only entries for the current uploads are kept, which bounds memory.
+    prev_cache: Dict[Tuple, Tuple[str, Any]] = st.session_state.get("extract_cache", {})
+    extract_cache = {key: prev_cache[key] for *_, key in files if key in prev_cache}
+    todo = [
+        i for i, (_, _, _, _, first, key) in enumerate(files)
+        if first == i and key not in extract_cache
+    ]
+
+    # Parse the remaining files concurrently (native parsers release the GIL).
+    if todo:
+        ctx = get_script_run_ctx() if get_script_run_ctx else None
+        with ThreadPoolExecutor(
+            max_workers=min(8, len(todo)),
+            initializer=(lambda: add_script_run_ctx(threading.current_thread(), ctx)) if ctx else None,
+        ) as ex:
+            futures = {}
+            for i in todo:
+                filename, ext, _, raw, _, key = files[i]
+                futures[key] = ex.submit(extract_upload, raw, ext, filename, max_chars_per_file, max_rows_per_col)
+            for key, fut in futures.items():
+                extract_cache[key] = fut.result()
+    st.session_state.extract_cache = extract_cache
+
+    # results keep upload order; None marks a duplicate of an earlier upload
+    results = [extract_cache[key] if first == i else None for i, (*_, first, key) in enumerate(files)]
+
+    for (filename, _, mime, _, first, _), res in zip(files, results):
+        if res is None:
+            report_lines.append(f"- ♻️ {filename}（與 {files[first][0]} 內容相同，重用已解析結果，不重複納入）")
+            continue
 
+        kind, payload = res
         # Image files -> multimodal
-        if ext in ("png", "jpg", "jpeg", "webp"):
-            img = load_image_from_bytes(raw)
-            if img is not None:
-                images.append(img)
+        if kind == "image":
+            if payload is not None:
+                images.append(payload)
                 report_lines.append(f"- ✅ 圖檔：{filename}（多模態已附加）")
             else:
                 report_lines.append(f"- ⚠️ 圖檔：{filename}（讀取失敗，請換格式或重傳）")
             continue
 
-        # Text extractable
-        extracted = ""
-
-        if ext in ("csv", "xlsx", "xls"):
-            extracted = extract_text_from_table_bytes(
-                raw=raw,
-                filename=filename,
-                max_chars=max_chars_per_file,
-                max_rows_per_col=max_rows_per_col
-            )
-
-        elif ext in ("txt", "md"):
-            extracted = extract_text_from_plain_bytes(raw, max_chars=max_chars_per_file)
-
-        elif ext in ("pdf",):
-            extracted = extract_text_from_pdf_bytes(raw, max_chars=max_chars_per_file)
-
-        elif ext in ("docx",):
-            extracted = extract_text_from_docx_bytes(raw, max_chars=max_chars_per_file)
-
-        elif ext in ("html", "htm"):
-            extracted = extract_text_from_html_bytes(raw, max_chars=max_chars_per_file)
-
-        elif ext in ("rtf",):
-            extracted = extract_text_from_rtf_bytes(raw, max_chars=max_chars_per_file)
-
-        else:
-            # fallback: try read as text
-            extracted = extract_text_from_plain_bytes(raw, max_chars=max_chars_per_file)
-
-        extracted = (extracted or "").strip()
+        extracted = (payload or "").strip()
         if extracted:
-            remaining = max_total_chars - total_chars
             if remaining <= 0:
                 report_lines.append(f"- ⏭️ {filename}（可抽字但已達總字元上限，略過）")
                 continue
 
-            if len(extracted) > remaining:
+            n = len(extracted)
+            if n > remaining:
                 extracted = extracted[:remaining] + "\n\n[TRUNCATED_BY_TOTAL_LIMIT]"
+                n = len(extracted)
 
-            total_chars += len(extracted)
-            sample_blocks.append(f"=== [FILE: {filename} | {mime}] ===\n{extracted}\n=== [/FILE] ===")
-            report_lines.append(f"- ✅ 可抽字：{filename}（納入 {len(extracted):,} 字）")
+            total_chars += n
+            remaining -= n
+            write_sample_block(sample_buf, f"=== [FILE: {filename} | {mime}] ===", extracted, "=== [/FILE] ===")
+            report_lines.append(f"- ✅ 可抽字：{filename}（納入 {n:,} 字）")
         else:
             report_lines.append(
                 f"- ⚠️ {filename}（抽不到文字/摘要；可能是掃描PDF或格式不支援。建議貼關鍵段落或改傳可選取文字版本）"
             )
 
 if pasted.strip():
-    remaining = max_total_chars - total_chars
     paste_txt = clamp_text(pasted.strip(), remaining)
     if paste_txt:
-        sample_blocks.append(f"=== [PASTED] ===\n{paste_txt}\n=== [/PASTED] ===")
-        report_lines.append(f"- ✅ 直接貼上文本（納入 {len(paste_txt):,} 字）")
-        total_chars += len(paste_txt)
+        write_sample_block(sample_buf, "=== [PASTED] ===", paste_txt, "=== [/PASTED] ===")
+        n = len(paste_txt)
+        report_lines.append(f"- ✅ 直接貼上文本（納入 {n:,} 字）")
+        total_chars += n
+        remaining -= n
     else:
         report_lines.append("- ⏭️ 直接貼上文本（已達總字元上限，略過）")
 
 attachments_report = "\n".join(report_lines) if report_lines else "- （未上傳任何附件）"
 
 prompt_text = build_prompt(
-    sample_blocks=sample_blocks,
+    samples_text=sample_buf.getvalue(),
     notes=notes,
     constraints=constraints,
     output_language=output_language,
     attachments_report=attachments_report
 )
 
-# history
+# history (bounded deque: newest first, older entries evicted automatically)
 if "history" not in st.session_state:
-    st.session_state.history = []
+    st.session_state.history = collections.deque(maxlen=HISTORY_MAX)
+
+if queue:
+    st.session_state.pending.append(
+        {
+            "ts": now_str(),
+            "prompt_text": prompt_text,
+            "images": list(images),
+            "temperature": temperature,
+            "max_output_tokens": max_output_tokens,
+            "output_language": output_language,
+            "constraints": constraints,
+            "total_text_chars": total_chars,
+            "images_count": len(images),
+        }
+    )
+    st.session_state.queue_notice = f"已加入批次佇列（共 {len(st.session_state.pending)} 筆）。調整筆記/限制/temperature 後可再加入。"
+    # the batch button was rendered with the old queue; rerun so its count/disabled state is current
+    st.rerun()
+
+queue_notice = st.session_state.pop("queue_notice", None)
+if queue_notice:
+    st.success(queue_notice)
+
+if run_batch:
+    if not api_key.strip():
+        st.error("缺少 GEMINI_API_KEY。請在側欄貼上。")
+    else:
+        jobs = st.session_state.pending
+        with st.spinner(f"批次生成中（{len(jobs)} 筆，並行送出）…"):
+            results = call_gemini_batch(api_key.strip(), jobs)
+        st.session_state.pending = []
+
+        for job, (output, _) in zip(jobs, results):
+            if output and save_history:
+                st.session_state.history.appendleft(
+                    {
+                        "ts": now_str(),
+                        "model": MODEL_NAME,
+                        "temperature": job["temperature"],
+                        "max_output_tokens": job["max_output_tokens"],
+                        "output_language": job["output_language"],
+                        "constraints": job["constraints"],
+                        "total_text_chars": job["total_text_chars"],
+                        "images_count": job["images_count"],
+                        "output": output,
+                    }
+                )
+
+        # shown after the rerun below, which refreshes the batch button for the now-empty queue
+        st.session_state.batch_results = list(zip(jobs, results))
+        st.rerun()
+
+batch_results = st.session_state.pop("batch_results", None)
+if batch_results:
+    st.subheader("📦 批次結果")
+    for i, (job, (output, err)) in enumerate(batch_results, start=1):
+        with st.expander(
+            f"{i}. temp={job['temperature']} | {job['output_language']} | img={job['images_count']}",
+            expanded=(i == 1),
+        ):
+            if err:
+                st.error(f"呼叫 Gemini 失敗：{err}")
+            else:
+                st.write(output)
 
 if run:
     if not api_key.strip():
@@ -507,26 +1166,47 @@ if run:
             st.write(attachments_report)
             st.caption(f"文本合計納入：{total_chars:,} 字｜圖片附加：{len(images)} 張")
 
-        with st.spinner("生成中…"):
-            try:
-                output = call_gemini_multimodal(
-                    api_key=api_key.strip(),
-                    prompt_text=prompt_text,
-                    images=images,
-                    temperature=temperature,
-                    max_output_tokens=max_output_tokens,
-                )
-            except Exception as e:
-                st.error(f"呼叫 Gemini 失敗：{e}")
-                output = ""
-
-        if output:
-            st.subheader("✅ 生成結果")
+        st.subheader("✅ 生成結果")
+        # LRU of recent responses, capped like history (each entry is a full model output)
+        resp_cache: "collections.OrderedDict[str, str]" = st.session_state.setdefault(
+            "resp_cache", collections.OrderedDict()
+        )
+        resp_key = response_key(prompt_text, images, temperature, max_output_tokens)
+        cached = resp_key in resp_cache
+
+        if cached:
+            # identical inputs: reuse the previous response instead of calling Gemini again
+            resp_cache.move_to_end(resp_key)
+            output = resp_cache[resp_key]
+            st.caption("♻️ 輸入與參數皆未變更，直接重用上次結果（未呼叫 Gemini）。")
             st.write(output)
+        else:
+            with st.spinner("生成中…"):
+                try:
+                    # render tokens as they arrive; write_stream returns the concatenated text
+                    output = st.write_stream(
+                        stream_gemini_multimodal(
+                            api_key=api_key.strip(),
+                            prompt_text=prompt_text,
+                            images=images,
+                            temperature=temperature,
+                            max_output_tokens=max_output_tokens,
+                        )
+                    )
+                except Exception as e:
+                    st.error(f"呼叫 Gemini 失敗：{e}")
+                    output = ""
+
+            if not isinstance(output, str):
+                output = "".join(str(x) for x in (output or []))
+            if output:
+                resp_cache[resp_key] = output
+                while len(resp_cache) > HISTORY_MAX:
+                    resp_cache.popitem(last=False)
 
-            if save_history:
-                st.session_state.history.insert(
-                    0,
+        if output:
+            if save_history and not cached:
+                st.session_state.history.appendleft(
                     {
                         "ts": now_str(),
                         "model": MODEL_NAME,
@@ -564,7 +1244,7 @@ if run:
 
             st.download_button(
                 "下載 JSON（含輸入/證據摘要/輸出）",
-                data=json.dumps(export_payload, ensure_ascii=False, indent=2),
+                data=json_bytes(export_payload),
                 file_name=f"voice_analysis_{dt.datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
                 mime="application/json",
                 use_container_width=True
@@ -580,7 +1260,7 @@ if run:
 st.divider()
 st.subheader("📚 Session History（本次瀏覽器期間）")
 if st.session_state.history:
-    for i, item in enumerate(st.session_state.history[:10], start=1):
+    for i, item in enumerate(st.session_state.history, start=1):
         with st.expander(
             f"{i}. {item['ts']} | {item['model']} | temp={item['temperature']} | img={item['images_count']} | chars={item['total_text_chars']:,}"
         ):